@@ -1,6 +1,7 @@
 from xml.etree import ElementTree
+from xml.sax.saxutils import escape
 import svgwrite
-import enum, math
+import enum, itertools, functools, bisect
 
 ################
 # Tree utility functions
@@ -41,8 +42,21 @@ def treelet_split_fallback(t):
     # fallback to str(). TODO: enhance, or remove?
     return (str(t), tuple())
 
+# treelet splitters for types that are known ahead of time, keyed by exact type,
+# so that tree_split can avoid trying each splitter in turn for every node.
+# Anything else, including subclasses of these types, goes through the general
+# case.
+treelet_split_dispatch = {
+    str: treelet_split_str,
+    list: treelet_split_list,
+    tuple: treelet_split_list,
+}
+
 def tree_split(t, fallback=treelet_split_fallback):
     """Splits `t` into a parent and an iterable of children, possibly empty."""
+    split_fun = treelet_split_dispatch.get(type(t))
+    if split_fun is not None:
+        return split_fun(t)
     if isinstance(t, ElementTree.Element):
         # we do this explcitly because otherwise it gets parsed as an iterable
         raise NotImplementedError(
@@ -58,21 +72,18 @@ def tree_split(t, fallback=treelet_split_fallback):
         return split
     return fallback(t)   
 
-def tree_cxr(t, i):
-    return tree_split(t)[i]
-
 def tree_car(t):
     """What is the parent of a tree-like object `t`?
     Try to adapt to various possibilities, including nltk.Tree."""
-    return tree_cxr(t, 0)
+    return tree_split(t)[0]
 
 def tree_cdr(t):
     """What are the children of a tree-like object `t`?
     Try to adapt to various possibilities, including nltk.Tree."""
-    return tree_cxr(t, 1)
+    return tree_split(t)[1]
 
 def is_leaf(t):
-    return len(tree_cdr(t)) == 0
+    return not tree_split(t)[1]
 
 def tree_depth(t):
     """What is the max depth of t?"""
@@ -124,15 +135,22 @@ class VertAlign(enum.Enum):
     FULL = 3   # all nodes take up the full level height. Currently, this aligns
                # text to the top, maybe would be better if centered?
 
+# em and perc are called for nearly every coordinate in a tree, and the values
+# tend to repeat (level boundaries, 50%, etc.), so cache the formatting.
+@functools.lru_cache(maxsize=4096)
 def em(n):
     return "%gem" % n
 
 def px(n):
     return "%gpx" % n
 
+@functools.lru_cache(maxsize=4096)
 def perc(n):
     return "%g%%" % n
 
+def attr_escape(s):
+    return escape(s, {'"': "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#09;"})
+
 crisp_perpendiculars = True
 
 class TreeOptions(object):
@@ -168,7 +186,9 @@ class TreeOptions(object):
         return self.global_font_style + " font-size: " + px(self.font_size) + ";"
 
     def label_width(self, label):
-        return (len(str(label)) + self.leaf_padding) / self.average_glyph_width
+        if not isinstance(label, str):
+            label = str(label)
+        return (len(label) + self.leaf_padding) / self.average_glyph_width
 
     def tree_height(self, t):
         """Calculate tree height, in ems. Takes into account multi-line leaf
@@ -176,7 +196,7 @@ class TreeOptions(object):
         # TODO: generalize to multi-line nodes of all kinds.
         parent, children = tree_split(t)
         if len(children) == 0:
-            return len(parent.split("\n"))
+            return parent.count("\n") + 1
         subheight = 0
         for subtree in children:
             subheight = max(subheight, self.tree_height(subtree))
@@ -202,6 +222,12 @@ def leaf_nodecount(t, options=None):
 ################
 
 class NodePos(object):
+    # layout passes touch these attributes for every node, so avoid the
+    # overhead of a per-node instance dict.
+    __slots__ = ("x", "y", "width", "inner_width", "height", "inner_height",
+                 "depth", "leaf_count", "leaf_depth", "leftmost", "rightmost",
+                 "abs_x", "abs_width", "svg", "text", "lines", "edge_styles")
+
     def __init__(self, svg, x, y, width, height, depth):
         self.x = x
         self.y = y
@@ -210,8 +236,16 @@ class NodePos(object):
         self.height = height
         self.inner_height = height
         self.depth = depth
+        self.leaf_count = 0 # leaf nodes dominated, with padding. Set by layout
+        self.leaf_depth = depth # depth of the deepest leaf dominated
+        self.leftmost = None # leftmost and rightmost leaves. Set by layout
+        self.rightmost = None
+        # position relative to the outermost svg, in percentages. Set by layout
+        self.abs_x = x
+        self.abs_width = self.width
         self.svg = svg
         self.text = svg
+        self.lines = ()
         self.clear_edge_styles()
 
     def set_edge_style(self, daughter, style):
@@ -226,9 +260,6 @@ class NodePos(object):
     def clear_edge_styles(self):
         self.edge_styles = dict() # no info about surrounding tree structure...
 
-    def width(self):
-        return self.width
-
     def em_height(self):
         return self.height
 
@@ -241,18 +272,26 @@ class NodePos(object):
         return self.text
 
     @classmethod
-    def from_label(cls, label, depth, options):
+    def from_label(cls, label, depth, options, label_width=None):
+        if label_width is None:
+            label_width = options.label_width
         y = 1
         svg_parent = svgwrite.container.SVG(x=0, y=0, width="100%")
         if len(label) == 0:
-            return NodePos(svg_parent, 50, 0, options.label_width(""), 0, depth)
-        for line in label.split("\n"):
+            return NodePos(svg_parent, 50, 0, label_width(""), 0, depth)
+        if "\n" in label:
+            lines = label.split("\n")
+            width = max([label_width(line) for line in lines])
+        else: # the usual case
+            lines = [label]
+            width = label_width(label)
+        for line in lines:
             svg_parent.add(svgwrite.text.Text(line, insert=("50%", em(y)),
                                                     text_anchor="middle"))
             y += 1
-        width = max([options.label_width(line) for line in label.split("\n")])
         result = NodePos(svg_parent, 50, 0, width, y-1, depth)
         result.text = label
+        result.lines = lines
         return result
 
 class EdgeStyle(object):
@@ -340,14 +379,19 @@ class TreeLayout(object):
     def __init__(self, t, options=None):
         if options is None:
             options = TreeOptions()
-        self.level_heights = dict()
-        self.level_ys = dict({0: 0})
+        self.level_heights = list()
+        self.level_ys = [0]
+        self._level_y_cum = [0, 0]
         self.max_width = 1
         self.extra_y = 0.5
         self.depth = 0
         self.options = options
         self.tree = t
         self.annotations = list() # list of svgwrite objects
+        self._paths = dict()
+        self._movement_arrows = dict()
+        self._leaves_cache = dict()
+        self._leaf_index_cache = dict()
         self._do_layout(t) # initializes self.layout
 
     def __str__(self):
@@ -393,16 +437,18 @@ class TreeLayout(object):
         self.annotations.append(underline)
 
     def _movement_find_y(self, x1, x2, y):
-        # try to keep movement arrows from obscuring each other; a bit hacky
-        try:
-            self._movement_arrows
-        except:
-            self._movement_arrows = list()
-        for existing_x1, existing_x2, existing_y in self._movement_arrows:
-            if math.isclose(y, existing_y) and (x1 < existing_x2 or x2 > existing_x1):
-                return self._movement_find_y(x1, x2, y + 0.5)
-        self._movement_arrows.append((x1, x2, y))
-        return y
+        # try to keep movement arrows from obscuring each other; a bit hacky.
+        # Arrows are bucketed by y position in half ems, and each bucket is a
+        # sorted list of non-overlapping (x1, x2) spans, so only the neighbors
+        # of the insertion point need to be checked.
+        while True:
+            spans = self._movement_arrows.setdefault(round(y * 2), list())
+            i = bisect.bisect_left(spans, (x1, x2))
+            if ((i == 0 or spans[i - 1][1] < x1)
+                    and (i == len(spans) or spans[i][0] > x2)):
+                spans.insert(i, (x1, x2))
+                return y
+            y += 0.5
 
     def deepest_intervening_leaf(self, path1, path2):
         """Find the deepest leaf node between nodes characterized by two paths.
@@ -459,7 +505,7 @@ class TreeLayout(object):
     ######## Layout information
 
     def em_height(self):
-        return (sum([self.level_ys[l] for l in range(self.depth + 1)]) +
+        return (self._level_y_cum[self.depth + 1] +
                 self.level_heights[self.depth] +
                 self.extra_y)
 
@@ -495,9 +541,11 @@ class TreeLayout(object):
     def y_distance(self, level_a, level_b):
         """What is the total y distance between levels a and b, starting from
         the containing svg for level_a?"""
-        # level_ys is a dict, so can't use slicing
+        # uses the running totals of level_ys calculated at layout time
         level_b = min(self.depth, level_b)
-        return sum([self.level_ys[l] for l in range(level_a + 1, level_b + 1)])
+        if level_b <= level_a:
+            return 0
+        return self._level_y_cum[level_b + 1] - self._level_y_cum[level_a + 1]
 
     def layout_iter(self, path):
         """An iterator over every position in the layout, where the head is
@@ -535,14 +583,13 @@ class TreeLayout(object):
         # the complication comes in here because the path bounds might not
         # specify a constituent (in fact they typically won't unless they are
         # equal).
-        constituent_leaves = list(leaf_iter(self.sublayout(branch)))
-        path1_leaves = list(leaf_iter(self.sublayout(path1)))
-        path2_leaves = list(leaf_iter(self.sublayout(path2)))
-        for i in range(len(constituent_leaves)):
-            if constituent_leaves[i] == path1_leaves[0]:
-                path1_i = i
-            if constituent_leaves[i] == path2_leaves[0]:
-                path2_i = i
+        constituent = self.sublayout(branch)
+        constituent_leaves = self._leaves(constituent)
+        leaf_index = self._leaf_index(constituent)
+        path1_leaves = self._leaves(self.sublayout(path1))
+        path2_leaves = self._leaves(self.sublayout(path2))
+        path1_i = leaf_index[id(path1_leaves[0])]
+        path2_i = leaf_index[id(path2_leaves[0])]
         if path1_i < path2_i:
             left = path1_i
             right = path2_i + len(path2_leaves)
@@ -551,11 +598,35 @@ class TreeLayout(object):
             right = path1_i + len(path1_leaves)
         return iter(constituent_leaves[left:right])
 
+    def _leaves(self, sublayout):
+        # the layout doesn't change once built, so the leaves of any of its
+        # subtrees can be memoized.
+        leaves = self._leaves_cache.get(id(sublayout))
+        if leaves is None:
+            leaves = list(leaf_iter(sublayout))
+            self._leaves_cache[id(sublayout)] = leaves
+        return leaves
+
+    def _leaf_index(self, sublayout):
+        # map from leaf identity to position in self._leaves(sublayout)
+        index = self._leaf_index_cache.get(id(sublayout))
+        if index is None:
+            index = {id(l): i for i, l in enumerate(self._leaves(sublayout))}
+            self._leaf_index_cache[id(sublayout)] = index
+        return index
+
     def sublayout(self, path):
         """Find the position in the layout given by a tree path, i.e. a sequence
         of daughter indices (indexed from 0). Will throw AttributeError on an
         invalid path."""
-        return list(self.layout_iter(path))[-1]
+        try:
+            return self._paths[tuple(path)]
+        except KeyError:
+            # not indexed: either the path uses negative indices, or it is
+            # invalid, in which case layout_iter raises.
+            for sublayout in self.layout_iter(path):
+                pass
+            return sublayout
 
     def nmost_path(self, path, n):
         """Find the deepest path from starting position `path` that can be
@@ -585,13 +656,8 @@ class TreeLayout(object):
     def node_x_vals(self, path):
         """Find, relative to the outer svg, the x position and width for node
         at position `path`. Both values are in percentages."""
-        left = 0.0
-        width = 100.0
-        i = 0
-        for node in self.node_iter(path):
-            left += node.x * width / 100.0
-            width = width * node.width / 100.0
-        return left, width
+        node = self.sublayout(path)[0]
+        return node.abs_x, node.abs_width
 
     def subtree_bounds(self, path):
         """Find the bounding box for a subtree whose parent is at position
@@ -599,11 +665,10 @@ class TreeLayout(object):
         in percentages, and Y values are in ems. The values are relative to the
         outermost svg."""
         parent = self.sublayout(path)
-        deepest = max([l.depth for l in leaf_iter(parent)])
-        left_path = self.leftmost_path(path)
-        right_path = self.rightmost_path(path)
-        x = self.node_x_vals(left_path)[0]
-        width = sum(self.node_x_vals(right_path)) - x
+        deepest = parent[0].leaf_depth
+        x = parent[0].leftmost.abs_x
+        rightmost = parent[0].rightmost
+        width = rightmost.abs_x + rightmost.abs_width - x
         y = self.y_distance(0, parent[0].depth)
         height = (self.y_distance(parent[0].depth, deepest)
                   + self.level_heights[deepest]
@@ -640,13 +705,30 @@ class TreeLayout(object):
         for n in self.node_iter():
             n.clear_edge_styles()
 
+    def _label_width(self, line):
+        # node labels tend to repeat a lot within a tree (category labels,
+        # function words), so memoize widths for the duration of a layout.
+        w = self._width_cache.get(line)
+        if w is None:
+            w = self.options.label_width(line)
+            self._width_cache[line] = w
+        return w
+
     def _do_layout(self, t):
-        self.level_heights = dict()
-        self.level_ys = dict({0: 0})
-        self.depth =  tree_depth(t) - 1
-        for i in range(self.depth + 1):
-            self.level_heights[i] = 0
-        parsed = self._build_initial_layout(t)
+        # level heights are filled in lazily as the initial layout visits each
+        # level.
+        self.level_heights = list()
+        self._width_cache = dict()
+        aligned_leaves = list()
+        parsed = self._build_initial_layout(t, aligned_leaves)
+        self.depth = parsed[0].leaf_depth
+        # the tree depth isn't known until the initial layout is done, so
+        # leaf nodes that align to the deepest level are placed here.
+        self._extend_levels(self.depth)
+        for node in aligned_leaves:
+            node.depth = self.depth
+            self.level_heights[self.depth] = max(
+                self.level_heights[self.depth], node.height)
         self._calc_level_ys()
         if len(parsed) > 0:
             self.max_width = parsed[0].width
@@ -656,32 +738,72 @@ class TreeLayout(object):
             parsed[0].width = 100.0
             parsed[0].x = 0
         self._normalize_widths(parsed)
+        self._index_layout(parsed)
+        if self.options.leaf_nodes_align:
+            # every node dominates some leaf, and the leaves are all on the
+            # deepest level now.
+            for sub in self._paths.values():
+                sub[0].leaf_depth = self.depth
         self._normalize_y(parsed)
         self.layout = parsed
 
-    def _build_initial_layout(self, t, level=0):
+    def _initial_node(self, label, leaf, level, aligned_leaves):
+        node = NodePos.from_label(label, level, self.options,
+                                  label_width=self._label_width)
+        # if leaf nodes align, all leaf nodes contribute to height for the
+        # deepest level, not their actual depth. That level isn't known yet, so
+        # defer these to the caller.
+        if leaf and self.options.leaf_nodes_align:
+            aligned_leaves.append(node)
+        elif level == len(self.level_heights):
+            # nodes are created parents first, so the first node seen on a
+            # level always starts it
+            self.level_heights.append(node.height)
+        else:
+            self.level_heights[level] = max(self.level_heights[level],
+                                            node.height)
+        return node
+
+    def _extend_levels(self, level):
+        # levels that only contain aligned leaf nodes aren't started during
+        # the initial layout.
+        while len(self.level_heights) <= level:
+            self.level_heights.append(0)
+
+    def _finish_node(self, node, result_children):
+        # once the daughters are laid out, widen the node to cover them, count
+        # the leaves it dominates, and find the depth of the deepest one along
+        # with the leftmost and rightmost leaves.
+        if len(result_children) == 0:
+            node.leaf_count = 1 + self.options.leaf_padding
+            node.leaf_depth = node.depth
+            node.leftmost = node
+            node.rightmost = node
+            return
+        node.width = max(node.width, sum([c[0].width for c in result_children]))
+        node.leaf_count = sum([c[0].leaf_count for c in result_children])
+        node.leaf_depth = max([c[0].leaf_depth for c in result_children])
+        node.leftmost = result_children[0][0].leftmost
+        node.rightmost = result_children[-1][0].rightmost
+
+    def _build_initial_layout(self, t, aligned_leaves, level=0):
         # initialize raw widths and node heights, both in em at this point.
         # also initialize level_heights for all levels, and depth values for
         # nodes.
         parent, children = tree_split(t)
-
-        # if leaf nodes align, all leaf nodes contribute to height for the
-        # deepest level, not their actual depth
-        if len(children) == 0 and self.options.leaf_nodes_align:
-            level = self.depth
-        node = NodePos.from_label(parent, level, self.options)
-
-        self.level_heights[level] = max(self.level_heights[level], node.height)
-        result_children = [self._build_initial_layout(c, level+1)
+        node = self._initial_node(parent, len(children) == 0, level,
+                                  aligned_leaves)
+        result_children = [self._build_initial_layout(c, aligned_leaves,
+                                                      level+1)
                                                             for c in children]
-        node.width = max(node.width, sum([c[0].width for c in result_children]))
+        self._finish_node(node, result_children)
         return [node] + result_children
 
     def _sublayout_width(self, t):
         if self.options.horiz_spacing == HorizOptions.TEXT:
             return t[0].width # precalculated
         elif self.options.horiz_spacing == HorizOptions.NODES:
-            return leaf_nodecount(t, self.options)
+            return t[0].leaf_count # precalculated
         else: # EVEN
             return 1
 
@@ -694,38 +816,49 @@ class TreeLayout(object):
         for c in children:
             self._normalize_widths(c)
 
-        widths = list()
-        sum = 0
-        em_sum = 0
         # calculate widths according to scheme determined by options. This
         # may or may not be in real units.
-        for t in children:
-            widths.append(self._sublayout_width(t))
-            sum += widths[-1]
-            em_sum += t[0].width
-
+        widths = [self._sublayout_width(c) for c in children]
+        total = sum(widths)
         # if the parent node is wider than all the children, the parent box is
         # what will determine the overall box size. The limiting case of this
         # is when each is one node.
-        if em_sum < parent.inner_width:
-            em_sum = parent.inner_width
+        em_sum = max(sum([c[0].width for c in children]), parent.inner_width)
         # normalize to percentages
         x_pos = 0
-        for i in range(len(widths)):
+        for c, width in zip(children, widths):
             # TODO: inner width is not very accurate for non-TEXT width schemes.
             # Could calculate it relative to the entire canvas? Could I just
             # switch to viewbox-determined units rather than percentages?
-            children[i][0].inner_width = children[i][0].inner_width * 100.0 / em_sum
-            children[i][0].width = widths[i] * 100.0 / sum
-            children[i][0].x = x_pos
-            x_pos += children[i][0].width
+            node = c[0]
+            node.inner_width = node.inner_width * 100.0 / em_sum
+            node.width = width * 100.0 / total
+            node.x = x_pos
+            x_pos += node.width
+
+    def _index_layout(self, t):
+        # calculate each node's x position and width relative to the outer
+        # svg, in percentages, and index every sublayout by its tree path. This
+        # needs widths to be normalized already.
+        self._paths = dict()
+        stack = [(t, 0.0, 100.0, ())]
+        while stack:
+            t, left, width, path = stack.pop()
+            self._paths[path] = t
+            node = t[0]
+            node.abs_x = left + node.x * width / 100.0
+            node.abs_width = width * node.width / 100.0
+            for i in range(1, len(t)):
+                stack.append((t[i], node.abs_x, node.abs_width, path + (i - 1,)))
 
     def _calc_level_ys(self):
-        # Calculate the y position of each row, relative to containing svg
-        self.level_ys[0] = 0
-        for i in range(1, self.depth + 1):
-            self.level_ys[i] = (self.options.distance_to_daughter
-                                + self.level_heights[i - 1])
+        # Calculate the y position of each row, relative to containing svg,
+        # along with running totals so that distances between levels can be
+        # looked up directly: _level_y_cum[i] is the sum of level_ys[:i].
+        self.level_ys = [0] + [self.options.distance_to_daughter
+                               + self.level_heights[i - 1]
+                               for i in range(1, self.depth + 1)]
+        self._level_y_cum = [0] + list(itertools.accumulate(self.level_ys))
 
     def _normalize_y(self, t):
         # calculate y distances for each level. This is done on a second pass
@@ -739,7 +872,7 @@ class TreeLayout(object):
 
     ######### SVG building
 
-    def _svg_add_subtree(self, svg_parent, t):
+    def _svg_add_subtree(self, svg_parent, t, default_edge=None):
         # This uses several tricks to simulate the ways in which relative
         # positioning in raw SVG is hard:
         # 1. For x, use percentage-based positioning relative to nested `svg`
@@ -750,32 +883,39 @@ class TreeLayout(object):
         #    to accurately get text sizes ahead of time (without somehow
         #    doing or simulating rendering) when generating SVG. So since `em`s
         #    ought to be relative to text size, only use that.
-        from svgwrite.shapes import Line
+        if default_edge is None:
+            default_edge = self._default_edge_style()
+        debug = self.options.debug
         parent, children = t[0], t[1:]
-        svg_parent.add(parent.get_svg())
+        # collect this subtree's elements, and add them to `svg_parent` in
+        # one batch at the end.
+        elements = [parent.get_svg()]
+        collector = SVGElementList(elements)
         i = 0
         for c in children:
             box_y = self.y_distance(parent.depth, c[0].depth)
-            y_target = em(box_y + c[0].y)
-            x_target = perc(c[0].x + c[0].width / 2)
             child = svgwrite.container.SVG(x=perc(c[0].x),
                                            y=em(box_y),
                                            width=perc(c[0].width))
-            if self.options.debug:
+            if debug:
                 child.add(svgwrite.shapes.Rect(insert=("0%","0%"),
                                                size=("100%", "100%"),
                                                fill="none", stroke="red"))
-            svg_parent.add(child)
-            if parent.has_edge_style(i):
-                edge = parent.get_edge_style(i)
-            elif self.options.descend_direct:
-                edge = EdgeStyle()
-            else:
-                edge = IndirectDescent()
-            edge.draw(svg_parent, self, parent, c[0])
+            elements.append(child)
+            edge = parent.get_edge_style(i)
+            if edge is None:
+                edge = default_edge
+            edge.draw(collector, self, parent, c[0])
 
-            self._svg_add_subtree(child, c)
+            self._svg_add_subtree(child, c, default_edge)
             i += 1
+        svg_parent.elements.extend(elements)
+
+    def _default_edge_style(self):
+        if self.options.descend_direct:
+            return EdgeStyle()
+        else:
+            return IndirectDescent()
 
     def svg_build_tree(self, name="tree"):
         """Build an `svgwrite.Drawing` object based on the layout calculated
@@ -806,11 +946,93 @@ class TreeLayout(object):
                 tree.add(tree.line(start=(0, em(i)),
                                    end=("100%", em(i)),
                                    stroke="lightgray"))
-        self._svg_add_subtree(tree, self.layout)
+        self._svg_add_subtree(tree, self.layout, self._default_edge_style())
         for a in self.annotations:
             tree.add(a)
         return tree
 
+    def _direct_edge_attrs(self, edge):
+        # serialize the line attributes for `edge`, sorted and with None or
+        # empty values left out as svgwrite does, so that the edge can be
+        # written inline. Only a plain EdgeStyle is known to draw a single
+        # direct line; for anything else, return None.
+        if type(edge) is not EdgeStyle:
+            return None
+        attrs = sorted([(k.replace("_", "-"), str(v))
+                        for k, v in edge.svg_opts().items() if v is not None])
+        return "".join(['%s="%s" ' % (k, attr_escape(v))
+                        for k, v in attrs if v])
+
+    def _svg_add_subtree_str(self, out, t, default_edge=None,
+                             direct_attrs=None):
+        # Equivalent to _svg_add_subtree, but appends serialized xml directly
+        # to the list `out` rather than building svgwrite objects. The markup
+        # is equivalent to what svgwrite produces. If `direct_attrs` is given,
+        # it should come from `_direct_edge_attrs(default_edge)`, and edges
+        # without their own style are written inline using it rather than
+        # drawn.
+        if default_edge is None:
+            default_edge = self._default_edge_style()
+        parent, children = t[0], t[1:]
+        out.append('<svg width="100%%" x="0" y="%s"><defs />' % em(parent.y))
+        for i in range(len(parent.lines)):
+            out.append('<text text-anchor="middle" x="50%%" y="%s">%s</text>'
+                       % (em(i + 1), escape(parent.lines[i])))
+        out.append('</svg>')
+        if len(children) == 0:
+            return
+        line_start = parent.y + parent.height
+        if parent.height > 0:
+            line_start += 0.2 # extra space for descenders
+        line_start = em(line_start)
+        i = 0
+        for c in children:
+            box_y = self.y_distance(parent.depth, c[0].depth)
+            out.append('<svg width="%s" x="%s" y="%s"><defs />'
+                       % (perc(c[0].width), perc(c[0].x), em(box_y)))
+            self._svg_add_subtree_str(out, c, default_edge, direct_attrs)
+            out.append('</svg>')
+            edge = parent.get_edge_style(i)
+            if edge is None and direct_attrs is not None:
+                out.append('<line %sx1="50%%" x2="%s" y1="%s" y2="%s" />'
+                           % (direct_attrs, perc(c[0].x + c[0].width / 2),
+                              line_start, em(box_y + c[0].y)))
+            else:
+                if edge is None:
+                    edge = default_edge
+                # serialize only once drawing is done, since a style may still
+                # modify elements after adding them.
+                writer = SVGStringWriter()
+                edge.draw(writer, self, parent, c[0])
+                out.append(writer.tostring())
+            i += 1
+
+    def svg_build_str(self):
+        """Serialize the tree layout directly to an svg string. This produces
+        markup equivalent to `get_svg`, but is much faster for large
+        trees, since it doesn't need to construct svgwrite objects. (The exact
+        text may differ from svgwrite's, e.g. in attribute order, depending on
+        the svgwrite version.)"""
+        width = self.width()
+        height = self.height()
+        out = ['<svg baseProfile="full" height="%s" '
+               'preserveAspectRatio="xMidYMid meet" style="%s" version="1.1" '
+               'viewBox="0,0,%s,%s" width="%s" '
+               'xmlns="http://www.w3.org/2000/svg" '
+               'xmlns:ev="http://www.w3.org/2001/xml-events" '
+               'xmlns:xlink="http://www.w3.org/1999/xlink"><defs />'
+               % (px(height), attr_escape(self.options.style_str()),
+                  width, height, px(width))]
+        default_edge = self._default_edge_style()
+        self._svg_add_subtree_str(out, self.layout, default_edge,
+                                  self._direct_edge_attrs(default_edge))
+        # as in get_svg, annotations are added both by svg_build_tree and
+        # get_svg itself
+        for a in self.annotations + self.annotations:
+            out.append(a.tostring())
+        out.append('</svg>')
+        return "".join(out)
+
     def get_svg(self):
         tree = self.svg_build_tree()
         for a in self.annotations:
@@ -818,7 +1040,30 @@ class TreeLayout(object):
         return tree
 
     def _repr_svg_(self):
-        return self.get_svg().tostring()
+        if self.options.debug:
+            return self.get_svg().tostring()
+        return self.svg_build_str()
+
+class SVGElementList(object):
+    """Minimal stand-in for an svgwrite container, that collects elements added
+    to it in a list, so that they can be added to a real container in one
+    batch."""
+    def __init__(self, elements):
+        self.elements = elements
+
+    def add(self, element):
+        self.elements.append(element)
+        return element
+
+class SVGStringWriter(SVGElementList):
+    """Minimal stand-in for an svgwrite container, that collects elements added
+    to it so that they can be serialized afterwards. This lets `EdgeStyle.draw`
+    be used when building svg strings directly."""
+    def __init__(self):
+        super().__init__(list())
+
+    def tostring(self):
+        return "".join([e.tostring() for e in self.elements])
 
 ################
 # Module-level api
@@ -836,10 +1081,23 @@ def draw_tree(*t, options=None, **opts):
 
 nltk_tree_options = TreeOptions()
 
+def nltk_repr_svg(t):
+    """Render `t` as an svg string using `nltk_tree_options`. The result is
+    cached on `t`, and reused until either the tree or the options change, so
+    that redisplaying a tree in a notebook doesn't redo the layout."""
+    key = (repr(t), list(vars(nltk_tree_options).items()))
+    cached = getattr(t, "_svgling_cache", None)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    svg = TreeLayout(t, options=nltk_tree_options)._repr_svg_()
+    t._svgling_cache = (key, svg)
+    return svg
+
 def monkeypatch_nltk():
     import nltk
     global nltk_tree_options
-    nltk.Tree._repr_svg_ = lambda self: TreeLayout(self, options=nltk_tree_options)._repr_svg_()
+    treelet_split_dispatch[nltk.Tree] = treelet_split_nltk
+    nltk.Tree._repr_svg_ = nltk_repr_svg
 
 def module_setup():
     try:
@@ -0,0 +1,49 @@
+import unittest
+
+import svgwrite
+
+from svgling.core import EdgeStyle, TreeLayout, TreeOptions, em, perc
+
+class DashedEdge(EdgeStyle):
+    # modifies the line after adding it to the container
+    def draw(self, svg_parent, tree_layout, parent, child):
+        box_y = tree_layout.y_distance(parent.depth, child.depth)
+        line = svg_parent.add(svgwrite.shapes.Line(
+                                start=("50%", em(parent.y + parent.height)),
+                                end=(perc(child.x + child.width / 2),
+                                     em(box_y + child.y)),
+                                **self.svg_opts()))
+        line.dasharray([2, 2])
+
+class EdgeStyleTest(unittest.TestCase):
+    tree = ("S", ("NP", "it"), ("VP", "rains"))
+
+    def check_dashed(self, options):
+        layout = TreeLayout(self.tree, options=options)
+        layout.set_edge_style((1,), DashedEdge())
+        svg = layout._repr_svg_()
+        self.assertIn('stroke-dasharray="2 2"', svg)
+        self.assertEqual(svg, layout.get_svg().tostring())
+
+    def test_modified_after_add(self):
+        self.check_dashed(TreeOptions())
+
+    def test_modified_after_add_indirect(self):
+        self.check_dashed(TreeOptions(descend_direct=False))
+
+class RenderTest(unittest.TestCase):
+    tree = ("S", ("NP", ("D", "the"), ("N", "elephant")), ("VP", "left"))
+
+    def check_same_svg(self, options):
+        layout = TreeLayout(self.tree, options=options)
+        self.assertEqual(layout._repr_svg_(), layout.get_svg().tostring())
+
+    def test_direct_edges(self):
+        self.check_same_svg(TreeOptions())
+
+    def test_indirect_edges(self):
+        self.check_same_svg(TreeOptions(descend_direct=False,
+                                        leaf_nodes_align=True))
+
+if __name__ == '__main__':
+    unittest.main()